@@ -1,10 +1,10 @@
 import argparse
 import concurrent.futures
+import functools
+import json
+import math
 import time
-import matplotlib.pyplot as plt
-import numpy as np
 
-from string import Template
 from datetime import datetime, timedelta
 from dateutil.parser._parser import ParserError
 from multiprocessing import current_process
@@ -12,9 +12,18 @@ from dateutil.parser import parse
 from dateutil.relativedelta import *
 from atlassian import Confluence
 
+from requests.adapters import HTTPAdapter, Retry
 from requests.exceptions import HTTPError
 from atlassian.errors import ApiError
 
+# orjson decodes large JSON payloads a few times faster than the stdlib json
+# module, which matters for the big expanded page-fetch responses. It's purely
+# optional though: without it installed we just fall back to the stdlib.
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
 # DEBUG will go bonkers and print *a lot* of debugging information that can be
 # useful for, well, debugging, obviously.
 DEBUG = False
@@ -31,85 +40,166 @@ deprecated_labels = [
 ]
 
 # The labels we want to apply to pages.
-# 
+#
 # !!!
 # WARNING: DO NOT EDIT THIS DIRECTLY. THE ORDER IS IMPORTANT.
 # !!!
 target_labels = []
 
+# Frozen set views of the above, giving us O(1) membership checks and C-level
+# intersections in the per-page hot path. TARGET_LABEL_SET is rebuilt in main()
+# once the label flags have been parsed.
+DEPRECATED_LABEL_SET = frozenset(deprecated_labels)
+TARGET_LABEL_SET = frozenset(target_labels)
+
 # Using "lifecycle_ignore" comes in two flavours:
 #  1. Simply use "lifecycle_ignore" to ignore the page forever
 #  2. Use "lifecycle_ignore=<ISO>" to ignore the page until *after* <ISO>
 #  2.1 <ISO> is an ISO formatted date without time (zone) information: 20230101, 20210918, <YYYY><MM><DD>
 lifecycle_ignore_tag = "lifecycle_ignore"
 
-def discover_all_pages_in_space(space, max=100, limit=500):
+# The moment the run started. Confluence reports its timestamps in UTC, so all
+# of the date comparisons are done in UTC against this single clock reading -
+# utcnow() also skips the timezone lookup that now() performs on every call.
+run_started = datetime.utcnow()
+
+# The body of the central reporting page, filled in via str.format_map with the
+# figures from the run.
+PAGE_BODY_TEMPLATE = """
+<h2>Warning!</h2>
+<p>This page is <strong>automated!</strong> Do not edit it directly or manually. Your work will be lost when the automated process next runs.</p>
+
+<h2>The Latest Run</h2>
+<ol>
+  <li>The last run was on {runDate}</li>
+  <li>Total number of pages managed: {totalPagesManaged}</li>
+</ol>
+
+<h2>The Pie</h2>
+<p>A visualisation of how the last run applied labels to each page is managed. The pie is not edible.</p>
+<ac:image ac:align="center" ac:height="300">
+  <ri:attachment ri:filename="pie.svg" />
+</ac:image>
+
+<h2>Latest Figures</h2>
+<p>here are the latest figures from the latest run:</p>
+<table>
+  <tbody>
+    <tr>
+      <th>Fresh</th>
+      <th>Stale</th>
+      <th>Rotten</th>
+    </tr>
+    <tr>
+      <td>{freshPages}</td>
+      <td>{stalePages}</td>
+      <td>{rottenPages}</td>
+    </tr>
+  </tbody>
+</table>
+
+<h2>Change Statistics</h2>
+<p>Below we list statistics about how many changes were made in each category:</p>
+<table>
+  <tbody>
+    <tr>
+      <th>Fresh</th>
+      <th>Stale</th>
+      <th>Rotten</th>
+    </tr>
+    <tr>
+      <td>{freshPagesChanged}</td>
+      <td>{stalePagesChanged}</td>
+      <td>{rottenPagesChanged}</td>
+    </tr>
+  </tbody>
+</table>
+
+<h2>Lifecycle Statistics</h2>
+<p>These counters are the number of pages with lifecycle_ignore labels that resulted in no change, even if change was desired by the algorithm.</p>
+<p>For example, if the counter for "rotten" says 100, then on the last run 100 pages were detected as being rotten but were not changed as they had a lifecycle_ignore policy in place.</p>
+<table>
+  <tbody>
+    <tr>
+      <th>Fresh</th>
+      <th>Stale</th>
+      <th>Rotten</th>
+    </tr>
+    <tr>
+      <td>{freshPagesLifecycleTrigger}</td>
+      <td>{stalePagesLifecycleTrigger}</td>
+      <td>{rottenPagesLifecycleTrigger}</td>
+    </tr>
+  </tbody>
+</table>
+"""
+
+def parse_json_response(response):
+  """Decodes the body of a raw API response, preferring orjson when installed.
+
+  Keyword arguments:
+  response -- the requests Response object from an advanced_mode API call
+  """
+
+  if orjson is not None:
+    return orjson.loads(response.content)
+
+  return json.loads(response.content)
+
+def discover_all_pages_in_space(space, max=100, limit=500, workers=8):
   """Finds all pages inside of space, to a max number of pages, limit pages at a time.
-  
+
   Keyword arguments:
   space -- the name of the space in Atlassian Confluence, i.e. "AA"
   max -- the maximum numbers of pages to manage (default: 100)
   limit -- the maximum number of pages to request in each API call (default: 500)
+  workers -- the number of pagination batches to fetch concurrently (default: 8)
   """
 
   if DEBUG: print(f"discover_all_pages_in_space({space}, {max}, {limit})")
 
-  start = 0
   pages = []
 
   if limit > max:
     if DEBUG: print(f"discover_all_pages_in_space({space}, {max}, {limit}): {limit} found to bigger than {max}, so setting limit to max")
     limit = max
 
-  count = 0
-  while count < max:
-    all_pages = client.get_all_pages_from_space(space, start=start, limit=limit)
-    count = len(all_pages)
-    if DEBUG: print(f"discover_all_pages_in_space({space}, {max}, {limit}): total pages found this cycle: {count}")
-
-    start += limit
-
-    if count == 0:
-      break
-
-    if count > 0:
-      pages = pages + all_pages
+  def fetch_batch(start):
+    # Asking the client for the raw response lets us decode the heaviest
+    # payloads of the whole run with the faster parser, rather than going
+    # through the wrapper's stdlib json decoding
+    response = client.get("rest/api/content", params={
+      "spaceKey": space,
+      "type": "page",
+      "start": start,
+      "limit": limit,
+      "expand": "metadata.labels,history.lastUpdated,history.createdBy",
+    }, advanced_mode=True)
+    response.raise_for_status()
+
+    return parse_json_response(response).get("results", [])
+
+  # Every pagination offset is independent of the others, so rather than waiting for
+  # each API round-trip to finish before starting the next, we fire them all off
+  # concurrently and stitch the batches back together in order. Offsets beyond the
+  # end of the space simply come back empty.
+  with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+    for all_pages in executor.map(fetch_batch, range(0, max, limit)):
+      count = len(all_pages)
+      if DEBUG: print(f"discover_all_pages_in_space({space}, {max}, {limit}): total pages found this cycle: {count}")
+
+      if count > 0:
+        pages.extend(all_pages)
 
   return pages
 
-def discover_page_labels(page_id):
-  """Discovers all the labels that a page already has.
-  
-  Keyword arguments:
-  page_id -- the Confluence page ID to work with.
-  """
-
-  if DEBUG: print(f"discover_page_labels({page_id})")
-
-  page_labels = client.get_page_labels(page_id)
-  
-  if len(page_labels['results']) == 0:
-    if DEBUG: print(f"discover_page_labels({page_id}) has no labels")
-
-    return {
-    "page_id": page_id,
-    "labels": None,
-  }
-
-  if DEBUG: print(f"discover_page_labels({page_id}) has labels: {page_labels['results']}")
-
-  return {
-    "page_id": page_id,
-    "labels": page_labels['results'],
-  }
-
-def discover_page_state(page_id, rotten_days=180, stale_days=90):
+def discover_page_state(page, date_rotten, date_stale):
   """Determines the state of the page in terms of its lifecycle phase.
-  
+
   Keyword arguments:
-  page_id -- the Confluence page ID to work with.
-  rotten_days -- the number of days since the last update after which a page is considered rotten (default: 180)
-  stale_days -- the number of days since the last update after which a page is considered stale (default: 90)
+  page -- the Confluence page, as returned by discover_all_pages_in_space(), with its history and labels expanded inline.
+  date_rotten -- pages last updated before this datetime are considered rotten
+  date_stale -- pages last updated before this datetime are considered stale
 
   Returns dict:
 
@@ -129,26 +219,27 @@ def discover_page_state(page_id, rotten_days=180, stale_days=90):
         "when_raw": string(datetime),
         "when": datetime,
       },
+      "labels": list(page's existing labels),
       "state": string(page's lifecycle phase),
     }
 
   """
 
+  page_id = page['id']
   if DEBUG: print(f"discover_page_state({page_id})")
 
-  page_properties = client.history(page_id)
+  # The history and labels were expanded into the page itself when we fetched it,
+  # so there's no need for any further API calls here.
+  page_properties = page['history']
 
-  # TODO: I hate how I'm having to chop the string up. I couldn't get string parsing working
-  # with the "T" and "Z" in there, so I gave up and bruteforced it, as you can see below. Ideally
-  # Python's datetime string parsing would be used instead.
-  last_updated_clean = page_properties['lastUpdated']['when'].replace("T", " ")
-  last_updated_cleaner = last_updated_clean.replace("Z", "")
+  # The timestamp is ISO 8601 with a trailing "Z"; strip that off and hand the
+  # rest straight to Python's C-level ISO parser. The result stays naive (in
+  # UTC), which matches the cutoff dates we compare against.
+  last_updated_raw = page_properties['lastUpdated']['when']
 
-  if DEBUG: print(f"discover_page_state({page_id}) was last updated {last_updated_cleaner}")
+  if DEBUG: print(f"discover_page_state({page_id}) was last updated {last_updated_raw}")
 
-  last_update = datetime.strptime(last_updated_cleaner, '%Y-%m-%d %H:%M:%S.%f')
-  date_rotten = datetime.now() - timedelta(days=rotten_days)
-  date_stale = datetime.now() - timedelta(days=stale_days)
+  last_update = datetime.fromisoformat(last_updated_raw.rstrip('Z'))
 
   # We strip off the "(Deactivated)" part of the name as we don't care about it.
   created_by = {
@@ -183,110 +274,186 @@ def discover_page_state(page_id, rotten_days=180, stale_days=90):
     "page_id": page_id,
     "created_by": created_by,
     "last_edited": last_edited,
+    "labels": page['metadata']['labels']['results'],
     "state": state,
   }
 
-def action_set_page_label(page_id, desired_label):
+@functools.lru_cache(maxsize=8)
+def undesirable_labels_for(desired_label):
+  """Returns the target labels we don't want alongside desired_label.
+
+  There are only ever three desired labels, so the cache means this is computed
+  once per label for the whole run instead of once per page. The cache is
+  cleared in main() when the label flags are parsed.
+
+  Keyword arguments:
+  desired_label -- the label we want to apply to the page
+  """
+
+  return TARGET_LABEL_SET - {desired_label}
+
+def parse_lifecycle_ignore_date(raw):
+  """Parses the date portion of a "lifecycle_ignore=<ISO>" label.
+
+  The documented format is a strict YYYYMMDD, which strptime handles far faster
+  than dateutil's full grammar parser, so try that first and only fall back to
+  dateutil for anything looser people may have typed in.
+
+  Keyword arguments:
+  raw -- the date string, i.e. everything after the "=" in the label
+  """
+
+  try:
+    return datetime.strptime(raw, '%Y%m%d')
+  except ValueError:
+    return parse(raw)
+
+def remove_page_labels(page_id, labels):
+  """Removes several labels from a page with a single API call.
+
+  The Confluence REST API accepts the name parameter multiple times on the
+  label delete endpoint, so a whole batch of removals only costs one
+  round-trip rather than one per label.
+
+  Keyword arguments:
+  page_id -- the Confluence page ID
+  labels -- the label names to remove from the page
+  """
+
+  return client.delete(f"rest/api/content/{page_id}/label", params=[('name', label) for label in labels])
+
+def action_set_page_label(page_id, desired_label, existing_labels):
   """Sets the page label to the desired label, removing deprecated labels.
 
   Keyword arguments:
   page_id -- the Confluence page ID
   desired_label -- the label we want to apply to the page
+  existing_labels -- the labels the page already has, as fetched during discovery
   """
 
   if DEBUG: print(f"action_set_page_label({page_id}, {desired_label}):")
-  existing_labels = client.get_page_labels(page_id)
 
-  # This little loop-in-a-loop will remove any deprecated labels.
-  for label in existing_labels['results']:
-    current_label = label['label']
-    for deprecated in deprecated_labels:
-      if deprecated == current_label:
-        if DEBUG: print(f"action_set_page_label({page_id}, {desired_label}): found deprecated label {deprecated}")
-        client.remove_page_label(page_id, current_label)
+  current_labels = {label['label'] for label in existing_labels}
 
   # Undesirable labels are different to deprecated labels. Undesirable labels are the two labels
   # we don't want out of the three we apply to documents. So if we want to apply "fresh" then the
   # labels "stale" and "rotten" are undesirable and should be removed if they're present
-  undesirable_labels = [x for x in target_labels if x != desired_label]
-  if DEBUG: print(f"action_set_page_label({page_id}, {desired_label}): has the following undesirable labels: {undesirable_labels}")
-
-  labelling_required = True
-  triggered_lifecycle_exception = False
-  lifecycle_exception_until = ""
-  for existing_label in existing_labels['results']:
-    current_label = existing_label['label']
-    
-    # First we check to match sure we're not meant to completely ignore the lifecycle of this particular page
-    if current_label.startswith(lifecycle_ignore_tag):
-      if not current_label.count('=') > 0:
-        # Completely ignore the page
-        labelling_required = False
-        triggered_lifecycle_exception = True
-        break
-      
-      # Work out whether or not we're inside of the ignore window
-      split = current_label.split("=")
-      if split[1] == "":
-        # We'll assume they meant "lifecycle_ignore"
-        labelling_required = False
-        triggered_lifecycle_exception = True
-        break
-
-      # Now try to parse their date tag and work with it
-      try:
-        parsed_date = parse(split[1])
-        if not datetime.now() > parse(split[1]):
-          # We're still inside the lifecycle exclusion window, so ignore the page
-          labelling_required = False
-          triggered_lifecycle_exception = True
-          lifecycle_exception_until = split[1]
-          break
-
-      except ParserError:
-        # We have a bad lifecycle label that we're going to ignore
-        # and label the page as normal
-        # TODO: probably need a better solution, like a comment on the page?
-        pass
-
-    if labelling_required and (current_label in undesirable_labels):
-      # We've found an undesirable label, so we need to remove it as it's
-      # not the same as the one we're going to add
-      try:
-        client.remove_page_label(page_id, current_label)
-      except (ApiError, HTTPError) as e:
-        if DEBUG: print(f"action_set_page_label({page_id}, {desired_label}): resulted in API error: {str(e)}")
-        continue
-
-    if labelling_required and (current_label == desired_label):
-      # Ignore the page if it already has the label we're looking to apply
-      labelling_required = False
-      break
-
-  if labelling_required:
-    if DEBUG: print(f"action_set_page_label({page_id}, {desired_label}): requires labelling")
+  undesirable_labels = undesirable_labels_for(desired_label)
+
+  # First we check to make sure we're not meant to ignore the lifecycle of this
+  # particular page. This happens before we go anywhere near the removal API, so
+  # a page with a lifecycle_ignore policy is left completely untouched.
+  lifecycle_labels = [label for label in current_labels if label.startswith(lifecycle_ignore_tag)]
+  for current_label in lifecycle_labels:
+    if not current_label.count('=') > 0:
+      # Completely ignore the page
+      if DEBUG: print(f"action_set_page_label({page_id}, {desired_label}): DOES NOT require labelling because of a lifecycle label")
+      return False, True
 
+    # Work out whether or not we're inside of the ignore window
+    split = current_label.split("=")
+    if split[1] == "":
+      # We'll assume they meant "lifecycle_ignore"
+      if DEBUG: print(f"action_set_page_label({page_id}, {desired_label}): DOES NOT require labelling because of a lifecycle label")
+      return False, True
+
+    # Now try to parse their date tag - once, not twice - and work with it
     try:
-      client.set_page_label(page_id, desired_label)
+      parsed_date = parse_lifecycle_ignore_date(split[1])
+    except ParserError:
+      # We have a bad lifecycle label that we're going to ignore
+      # and label the page as normal
+      # TODO: probably need a better solution, like a comment on the page?
+      continue
+
+    if run_started <= parsed_date:
+      # We're still inside the lifecycle exclusion window, so ignore the page
+      if DEBUG: print(f"action_set_page_label({page_id}, {desired_label}): DOES NOT require labelling until after {split[1]} because of a lifecycle label")
+      return False, True
+
+  # Second, sweep up everything we don't want in a single batched delete - both
+  # the deprecated labels and any undesirable labels the page carries
+  labels_to_remove = current_labels & (DEPRECATED_LABEL_SET | undesirable_labels)
+  if labels_to_remove:
+    if DEBUG: print(f"action_set_page_label({page_id}, {desired_label}): removing labels {labels_to_remove}")
+
+    try:
+      remove_page_labels(page_id, labels_to_remove)
     except (ApiError, HTTPError) as e:
       if DEBUG: print(f"action_set_page_label({page_id}, {desired_label}): resulted in API error: {str(e)}")
-      return False, False
 
-    return True, False
-  else:
-    if triggered_lifecycle_exception:
-      if DEBUG: print(f"action_set_page_label({page_id}, {desired_label}): DOES NOT require labelling because of a lifecycle label")
-      # We're NOT applying a label because a lifecycle label blocked the decision
-      return False, True
+  # Third, if the page already has the label we're looking to apply then the
+  # clean-up above was all that was needed
+  if desired_label in current_labels:
+    if DEBUG: print(f"action_set_page_label({page_id}, {desired_label}): DOES NOT require labelling because it's currently accurate")
+    # We're NOT applying a label because it's simply not required
+    return False, False
+
+  # And finally, apply the label the page should be carrying
+  if DEBUG: print(f"action_set_page_label({page_id}, {desired_label}): requires labelling")
+
+  try:
+    client.set_page_label(page_id, desired_label)
+  except (ApiError, HTTPError) as e:
+    if DEBUG: print(f"action_set_page_label({page_id}, {desired_label}): resulted in API error: {str(e)}")
+    return False, False
+
+  return True, False
+
+def render_pie_svg(slices, size=300):
+  """Renders a pie chart of the given slices as an SVG document string.
+
+  Three slices don't need a plotting library: a handful of <path> arcs does the
+  same job without matplotlib's import time and memory footprint.
+
+  Keyword arguments:
+  slices -- the (label, value, colour) tuples to chart, in order
+  size -- the width and height of the rendered SVG in pixels (default: 300)
+  """
+
+  total = sum(value for _, value, _ in slices)
+  centre = size / 2
+  radius = size * 0.33
+
+  parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" viewBox="0 0 {size} {size}">']
+
+  # Walk clockwise from twelve o'clock, one wedge per slice
+  angle = -math.pi / 2
+  for label, value, colour in slices:
+    if value == 0:
+      continue
+
+    fraction = value / total
+    angle_end = angle + fraction * 2 * math.pi
+
+    if fraction == 1:
+      # A full turn can't be expressed as a single arc, so special-case it
+      parts.append(f'<circle cx="{centre}" cy="{centre}" r="{radius}" fill="{colour}" />')
     else:
-      if DEBUG: print(f"action_set_page_label({page_id}, {desired_label}): DOES NOT require labelling because it's currently accurate")
-      # We're NOT applying a label because it's simply not required
-      return False, False
+      start_x = centre + radius * math.cos(angle)
+      start_y = centre + radius * math.sin(angle)
+      end_x = centre + radius * math.cos(angle_end)
+      end_y = centre + radius * math.sin(angle_end)
+      large_arc = 1 if fraction > 0.5 else 0
+      parts.append(
+        f'<path d="M{centre:.2f},{centre:.2f} L{start_x:.2f},{start_y:.2f} '
+        f'A{radius:.2f},{radius:.2f} 0 {large_arc},1 {end_x:.2f},{end_y:.2f} Z" fill="{colour}" />'
+      )
+
+    mid = angle + fraction * math.pi
+    label_x = centre + radius * 1.3 * math.cos(mid)
+    label_y = centre + radius * 1.3 * math.sin(mid)
+    parts.append(f'<text x="{label_x:.2f}" y="{label_y:.2f}" text-anchor="middle" dominant-baseline="middle">{label}</text>')
+
+    angle = angle_end
+
+  parts.append('</svg>')
+  return "".join(parts)
 
 def configure_atlassian_client(arguments):
   if INFO: print(f"Connecting to {arguments.hostname} and authenticating as {arguments.username} ^_^ !!")
 
-  global client 
+  global client
   client = Confluence(
     url = arguments.hostname,
     username = arguments.username,
@@ -294,59 +461,83 @@ def configure_atlassian_client(arguments):
     cloud = arguments.cloud,
   )
 
+  # Mount a connection pool big enough for all of our worker threads so that the
+  # TCP+TLS connections get reused between API calls, rather than paying for a
+  # fresh handshake on each one. The retry policy also takes care of the odd
+  # rate-limit or gateway blip from Atlassian Cloud for us.
+  pool_size = max(32, arguments.workers)
+  adapter = HTTPAdapter(
+    pool_connections = pool_size,
+    pool_maxsize = pool_size,
+    max_retries = Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+  )
+  client._session.mount('https://', adapter)
+  client._session.mount('http://', adapter)
+  client._session.headers['Connection'] = 'keep-alive'
+
 def manage_pages_in_space(arguments):
-  all_pages_in_space = discover_all_pages_in_space(arguments.space, max=arguments.maxpages)
-  all_pages_and_labels = [discover_page_labels(i['id']) for i in all_pages_in_space]
-  
-  # Second handle pages with labels
-  with concurrent.futures.ThreadPoolExecutor(max_workers=15) as executor:
-    thefuture = [executor.submit(discover_page_state, i['page_id'], arguments.rotten, arguments.stale) for i in all_pages_and_labels]
-  
-  pages_with_states = [f.result() for f in thefuture]
+  all_pages_in_space = discover_all_pages_in_space(arguments.space, max=arguments.maxpages, workers=arguments.workers)
+
+  # Work out the cutoff dates once for the whole run, rather than consulting the
+  # clock again for every single page inside the thread pool.
+  date_rotten = run_started - timedelta(days=arguments.rotten)
+  date_stale = run_started - timedelta(days=arguments.stale)
+
+  # Second work out the lifecycle state of each page. As soon as a page's state
+  # is known we hand it straight on to the labelling action on the same pool,
+  # rather than waiting for every page to be classified first - the discovery
+  # and mutation phases overlap instead of running back to back.
+  pages_with_states = []
+  action_futures = {}
+  with concurrent.futures.ThreadPoolExecutor(max_workers=arguments.workers) as executor:
+    state_futures = [executor.submit(discover_page_state, i, date_rotten, date_stale) for i in all_pages_in_space]
+
+    for future in concurrent.futures.as_completed(state_futures):
+      page = future.result()
+      pages_with_states.append(page)
+
+      # Only apply labels if we're not in read-only mode. A page's state is also
+      # the label we want it to carry, so it tells us everything we need here.
+      if not arguments.readonly:
+        action_futures[executor.submit(action_set_page_label, page['page_id'], page['state'], page['labels'])] = page['state']
+
+    # Tally up the label actions per lifecycle state as they finish
+    pages_updated = {label: 0 for label in target_labels}
+    pages_lifecycle_triggers = {label: 0 for label in target_labels}
+    for future in concurrent.futures.as_completed(action_futures):
+      change, lifecycle_trigger = future.result()
+      state = action_futures[future]
+      if change:
+        pages_updated[state] += 1
+
+      if lifecycle_trigger:
+        pages_lifecycle_triggers[state] += 1
+
   if DEBUG: print(f"len(pages_with_states)={len(pages_with_states)}")
 
-  all_rotten_pages = [i for i in pages_with_states if i['state'] == target_labels[2]]
-  all_stale_pages = [i for i in pages_with_states if i['state'] == target_labels[1]]
-  all_fresh_pages = [i for i in pages_with_states if i['state'] == target_labels[0]]
+  # Partition the pages by state in a single pass, rather than filtering the
+  # whole list once per state
+  buckets = {target_labels[0]: [], target_labels[1]: [], target_labels[2]: []}
+  for page in pages_with_states:
+    buckets[page['state']].append(page)
+
+  all_fresh_pages = buckets[target_labels[0]]
+  all_stale_pages = buckets[target_labels[1]]
+  all_rotten_pages = buckets[target_labels[2]]
   
   if DEBUG: print(f"len(all_rotten_pages)={len(all_rotten_pages)}")
   if DEBUG: print(f"len(all_stale_pages)={len(all_stale_pages)}")
   if DEBUG: print(f"len(all_fresh_pages)={len(all_fresh_pages)}")
 
-  # Only apply labels if we're not in read-only mode
+  # The labels were already applied in the pipeline above, so all that's left
+  # here is breaking the tallies back out into their per-state counters
   if not arguments.readonly:
-    # Keep count of the pages that were updated
-    rotten_pages_updated = 0
-    rotten_pages_lifecycle_triggers = 0
-    stale_pages_updated = 0
-    stale_pages_lifecycle_triggers = 0
-    fresh_pages_updated = 0
-    fresh_pages_lifecycle_triggers = 0
-
-    # Process unlabelled pages
-    for page in all_rotten_pages:
-      change, lifecycle_trigger = action_set_page_label(page['page_id'], target_labels[2])
-      if change:
-        rotten_pages_updated += 1
-
-      if lifecycle_trigger:
-        rotten_pages_lifecycle_triggers += 1
-    
-    for page in all_stale_pages:
-      change, lifecycle_trigger = action_set_page_label(page['page_id'], target_labels[1])
-      if change:
-        stale_pages_updated += 1
-
-      if lifecycle_trigger:
-        stale_pages_lifecycle_triggers += 1
-    
-    for page in all_fresh_pages:
-      change, lifecycle_trigger = action_set_page_label(page['page_id'], target_labels[0])
-      if change:
-        fresh_pages_updated += 1
-
-      if lifecycle_trigger:
-        fresh_pages_lifecycle_triggers += 1
+    fresh_pages_updated = pages_updated[target_labels[0]]
+    stale_pages_updated = pages_updated[target_labels[1]]
+    rotten_pages_updated = pages_updated[target_labels[2]]
+    fresh_pages_lifecycle_triggers = pages_lifecycle_triggers[target_labels[0]]
+    stale_pages_lifecycle_triggers = pages_lifecycle_triggers[target_labels[1]]
+    rotten_pages_lifecycle_triggers = pages_lifecycle_triggers[target_labels[2]]
   
   fresh_pages = len(all_fresh_pages)
   stale_pages = len(all_stale_pages)
@@ -364,119 +555,30 @@ def manage_pages_in_space(arguments):
   # Only update the central reporting page if we're not in read-only mode
   # and we're being asked to update the page
   if (not arguments.readonly) and arguments.updatepage:
-    y = []
-    pie_labels = []
-    pie_explode = []
-    pie_colours = []
-
-    if fresh_pages > 0:
-      y.append(fresh_pages)
-      pie_labels.append("Fresh")
-      pie_explode.append(0)
-      pie_colours.append("gray")
-
-    if stale_pages > 0:
-      y.append(stale_pages)
-      pie_labels.append("Stale")
-      pie_explode.append(0)
-      pie_colours.append("blue")
-
-    if rotten_pages > 0:
-      y.append(rotten_pages)
-      pie_labels.append("Rotten")
-      pie_explode.append(0.2)
-      pie_colours.append("red")
-
-    y = np.array(y)
-
-    plt.pie(y, labels = pie_labels, explode = pie_explode, colors = pie_colours, radius = 1.5)
-    plt.savefig('pie.png')
-    
-    client.attach_file('pie.png', page_id=arguments.pageid)
-
-    page_body = """
-    <h2>Warning!</h2>
-    <p>This page is <strong>automated!</strong> Do not edit it directly or manually. Your work will be lost when the automated process next runs.</p>
-    
-    <h2>The Latest Run</h2>
-    <ol>
-      <li>The last run was on $runDate</li>
-      <li>Total number of pages managed: $totalPagesManaged</li>
-    </ol>
-
-    <h2>The Pie</h2>
-    <p>A visualisation of how the last run applied labels to each page is managed. The pie is not edible.</p>
-    <ac:image ac:align="center" ac:height="300">
-      <ri:attachment ri:filename="pie.png" />
-    </ac:image>
-
-    <h2>Latest Figures</h2>
-    <p>here are the latest figures from the latest run:</p>
-    <table>
-      <tbody>
-        <tr>
-          <th>Fresh</th>
-          <th>Stale</th>
-          <th>Rotten</th>
-        </tr>
-        <tr>
-          <td>$freshPages</td>
-          <td>$stalePages</td>
-          <td>$rottenPages</td>
-        </tr>
-      </tbody>
-    </table>
-
-    <h2>Change Statistics</h2>
-    <p>Below we list statistics about how many changes were made in each category:</p>
-    <table>
-      <tbody>
-        <tr>
-          <th>Fresh</th>
-          <th>Stale</th>
-          <th>Rotten</th>
-        </tr>
-        <tr>
-          <td>$freshPagesChanged</td>
-          <td>$stalePagesChanged</td>
-          <td>$rottenPagesChanged</td>
-        </tr>
-      </tbody>
-    </table>
-    
-    <h2>Lifecycle Statistics</h2>
-    <p>These counters are the number of pages with lifecycle_ignore labels that resulted in no change, even if change was desired by the algorithm.</p>
-    <p>For example, if the counter for "rotten" says 100, then on the last run 100 pages were detected as being rotten but were not changed as they had a lifecycle_ignore policy in place.</p>
-    <table>
-      <tbody>
-        <tr>
-          <th>Fresh</th>
-          <th>Stale</th>
-          <th>Rotten</th>
-        </tr>
-        <tr>
-          <td>$freshPagesLifecycleTrigger</td>
-          <td>$stalePagesLifecycleTrigger</td>
-          <td>$rottenPagesLifecycleTrigger</td>
-        </tr>
-      </tbody>
-    </table>
-    """
-
-    page_body_template = Template(page_body)
-    page_body_result = page_body_template.substitute(
-      runDate=time.ctime(),
-      freshPages=fresh_pages,
-      stalePages=stale_pages,
-      rottenPages=rotten_pages,
-      freshPagesChanged=fresh_pages_updated,
-      stalePagesChanged=stale_pages_updated,
-      rottenPagesChanged=rotten_pages_updated,
-      freshPagesLifecycleTrigger=fresh_pages_lifecycle_triggers,
-      stalePagesLifecycleTrigger=stale_pages_lifecycle_triggers,
-      rottenPagesLifecycleTrigger=rotten_pages_lifecycle_triggers,
-      totalPagesManaged=total_pages_managed,
-    )
+    pie_slices = [
+      ("Fresh", fresh_pages, "gray"),
+      ("Stale", stale_pages, "blue"),
+      ("Rotten", rotten_pages, "red"),
+    ]
+
+    with open('pie.svg', 'w') as pie_file:
+      pie_file.write(render_pie_svg(pie_slices))
+
+    client.attach_file('pie.svg', page_id=arguments.pageid)
+
+    page_body_result = PAGE_BODY_TEMPLATE.format_map({
+      "runDate": time.ctime(),
+      "freshPages": fresh_pages,
+      "stalePages": stale_pages,
+      "rottenPages": rotten_pages,
+      "freshPagesChanged": fresh_pages_updated,
+      "stalePagesChanged": stale_pages_updated,
+      "rottenPagesChanged": rotten_pages_updated,
+      "freshPagesLifecycleTrigger": fresh_pages_lifecycle_triggers,
+      "stalePagesLifecycleTrigger": stale_pages_lifecycle_triggers,
+      "rottenPagesLifecycleTrigger": rotten_pages_lifecycle_triggers,
+      "totalPagesManaged": total_pages_managed,
+    })
   
     print(f"Updating the central reporting page at ID {arguments.pageid} ^_^ !!")
     
@@ -505,6 +607,7 @@ def main():
   parser.add_argument("-LS", "--stalelabel", type=str, help="The human-readable label for a stale page", default="lifecycle_phase=stale")
   parser.add_argument("-LR", "--rottenlabel", type=str, help="The human-readable label for a rotten page", default="lifecycle_phase=rotten")
   parser.add_argument("-r", "--readonly", help="Don't actually apply labels, just output DEBUG/INFO", action="store_true", default=False)
+  parser.add_argument("-w", "--workers", type=int, help="The number of concurrent worker threads used for API calls", default=32)
 
   arguments = parser.parse_args()
 
@@ -517,11 +620,14 @@ def main():
   if DEBUG: print(f"Labels set to: {arguments.freshlabel}, {arguments.stalelabel}, {arguments.rottenlabel}")
 
   global target_labels
+  global TARGET_LABEL_SET
   target_labels = [
     arguments.freshlabel,
     arguments.stalelabel,
     arguments.rottenlabel,
   ]
+  TARGET_LABEL_SET = frozenset(target_labels)
+  undesirable_labels_for.cache_clear()
 
   configure_atlassian_client(arguments)
   manage_pages_in_space(arguments)